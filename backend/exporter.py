@@ -0,0 +1,148 @@
+import csv
+import importlib.util
+import io
+from typing import Dict, Iterable, Iterator, List
+
+from store import parse_play_count
+
+# 导出列，顺序即输出顺序
+EXPORT_COLUMNS = [
+    "crawl_time",
+    "app_id",
+    "author_name",
+    "vid",
+    "title",
+    "publish_time",
+    "play_count",
+    "play_count_text",
+]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+DEFAULT_CHUNK_ROWS = 50000
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加的内存输出流，每写完一个分块就把已写入的字节取走，避免整份文件驻留内存"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _iter_chunks(records: Iterable[Dict], chunk_rows: int) -> Iterator[Dict[str, list]]:
+    """把记录流切成按列组织的分块"""
+    chunk = {name: [] for name in EXPORT_COLUMNS}
+    size = 0
+    for record in records:
+        for name in EXPORT_COLUMNS:
+            if name == "play_count":
+                chunk[name].append(parse_play_count(record.get('play_count', '0')))
+            else:
+                value = record.get(name)
+                chunk[name].append(None if value is None else str(value))
+        size += 1
+        if size >= chunk_rows:
+            yield chunk
+            chunk = {name: [] for name in EXPORT_COLUMNS}
+            size = 0
+    if size:
+        yield chunk
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        (name, pa.int64() if name == "play_count" else pa.string())
+        for name in EXPORT_COLUMNS
+    ])
+
+
+def export_csv(records: Iterable[Dict], chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[bytes]:
+    """以 CSV 格式分块输出（带 BOM，方便 Excel 直接打开中文）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield ("\ufeff" + buffer.getvalue()).encode('utf-8')
+
+    for chunk in _iter_chunks(records, chunk_rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(zip(*(chunk[name] for name in EXPORT_COLUMNS)))
+        yield buffer.getvalue().encode('utf-8')
+
+
+def export_arrow(records: Iterable[Dict], chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[bytes]:
+    """以 Arrow IPC stream 格式分块输出，每个分块对应一个 RecordBatch"""
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in _iter_chunks(records, chunk_rows):
+            writer.write_batch(pa.record_batch(chunk, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_parquet(records: Iterable[Dict], chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[bytes]:
+    """以 Parquet 格式分块输出，每个分块对应一个 row group"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for chunk in _iter_chunks(records, chunk_rows):
+            writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def format_available(fmt: str) -> bool:
+    """arrow / parquet 依赖可选的 pyarrow，未安装时不可用"""
+    if fmt == "csv":
+        return True
+    return fmt in EXPORT_FORMATS and importlib.util.find_spec("pyarrow") is not None
+
+
+def export_records(records: Iterable[Dict], fmt: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    将记录流导出为指定格式的字节流
+
+    Args:
+        records: 记录迭代器（通常来自 store.iter_records）
+        fmt: csv / arrow / parquet
+        chunk_rows: 每个分块的行数，决定导出时的内存上限
+
+    Returns:
+        Iterator[bytes]: 可直接写入响应体的数据块
+    """
+    if fmt == "csv":
+        return export_csv(records, chunk_rows)
+    if fmt == "arrow":
+        return export_arrow(records, chunk_rows)
+    if fmt == "parquet":
+        return export_parquet(records, chunk_rows)
+    raise ValueError(f"不支持的导出格式: {fmt}")
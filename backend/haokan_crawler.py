@@ -1,8 +1,24 @@
 import requests
+import socket
+import threading
 import time
 import json
+import importlib.util
 from typing import Dict, List, Optional, Iterator
 from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Referer': 'https://haokan.baidu.com/',
+}
+
+# urllib3 只有在安装了 brotli / brotlicffi 时才能解码 br
+BROTLI_AVAILABLE = any(importlib.util.find_spec(m) is not None for m in ("brotli", "brotlicffi"))
 
 @dataclass
 class VideoInfo:
@@ -29,20 +45,135 @@ class ApiResponse:
     ctime: str
     results: List[VideoInfo]
 
+class UpstreamStats:
+    """上游连接统计：新建连接数及其 DNS / TCP 连接 / TLS 握手耗时，请求数减去新建连接数即为复用次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.dns_seconds = 0.0
+        self.connect_seconds = 0.0
+        self.tls_seconds = 0.0
+
+    def record_connection(self, dns: float, connect: float, tls: float):
+        with self._lock:
+            self.connections += 1
+            self.dns_seconds += dns
+            self.connect_seconds += connect
+            self.tls_seconds += tls
+
+    def record_request(self, response, *args, **kwargs):
+        with self._lock:
+            self.requests += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            n = self.connections or 1
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "reused": max(self.requests - self.connections, 0),
+                "dns_ms_total": round(self.dns_seconds * 1000, 1),
+                "connect_ms_total": round(self.connect_seconds * 1000, 1),
+                "tls_ms_total": round(self.tls_seconds * 1000, 1),
+                "dns_ms_avg": round(self.dns_seconds * 1000 / n, 1),
+                "connect_ms_avg": round(self.connect_seconds * 1000 / n, 1),
+                "tls_ms_avg": round(self.tls_seconds * 1000 / n, 1),
+            }
+
+
+class _TimedConnectionMixin:
+    """在建立连接时分别记录 DNS 解析、TCP 连接和 TLS 握手耗时"""
+
+    stats: UpstreamStats = None
+
+    def _new_conn(self):
+        begin = time.perf_counter()
+        dns_host = self._dns_host
+        try:
+            # 先单独解析并计时，再依次尝试每个解析出的地址，保留 urllib3 多地址回退的行为
+            addresses = list(dict.fromkeys(
+                info[4][0] for info in socket.getaddrinfo(dns_host, self.port, 0, socket.SOCK_STREAM)))
+        except OSError:
+            # 解析失败交给 urllib3 按原逻辑处理并抛出对应的异常
+            addresses = [dns_host]
+        resolved = time.perf_counter()
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except Exception:
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+        self._timing = (resolved - begin, time.perf_counter() - resolved)
+        return sock
+
+    def connect(self):
+        self._timing = (0.0, 0.0)
+        begin = time.perf_counter()
+        super().connect()
+        total = time.perf_counter() - begin
+        dns, connect = self._timing
+        if self.stats is not None:
+            self.stats.record_connection(dns, connect, max(total - dns - connect, 0.0))
+
+
+class UpstreamAdapter(HTTPAdapter):
+    """带连接耗时统计的 HTTPAdapter，连接池大小与爬取并发数一致"""
+
+    def __init__(self, stats: UpstreamStats, pool_size: int):
+        self.stats = stats
+        attrs = {"stats": stats}
+        http_conn = type("TimedHTTPConnection", (_TimedConnectionMixin, HTTPConnection), attrs)
+        https_conn = type("TimedHTTPSConnection", (_TimedConnectionMixin, HTTPSConnection), attrs)
+        self._pool_classes = {
+            "http": type("TimedHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_conn}),
+            "https": type("TimedHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_conn}),
+        }
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self._pool_classes
+
+
+def create_session(pool_size: int = 4, stats: Optional[UpstreamStats] = None) -> requests.Session:
+    """
+    创建可在多个账号、多个线程间共享的 Session
+
+    Args:
+        pool_size: 每个 host 的连接池大小，应与爬取并发数一致
+        stats: 连接耗时统计，为 None 时新建一个（可通过 session.upstream_stats 读取）
+
+    Returns:
+        requests.Session: 复用 TCP/TLS 连接、接受 gzip/br 压缩的 Session
+    """
+    stats = stats or UpstreamStats()
+    session = requests.Session()
+    adapter = UpstreamAdapter(stats, pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    session.headers['Accept-Encoding'] = "gzip, deflate, br" if BROTLI_AVAILABLE else "gzip, deflate"
+    session.hooks['response'].append(stats.record_request)
+    session.upstream_stats = stats
+    return session
+
+
 class HaokanCrawler:
     """百度好看视频爬虫类"""
     
-    def __init__(self, app_id: str = "1844117067895852", base_url: str = "https://haokan.baidu.com/web/author/listall"):
+    def __init__(self, app_id: str = "1844117067895852", base_url: str = "https://haokan.baidu.com/web/author/listall",
+                 session: Optional[requests.Session] = None):
         self.app_id = app_id
         self.base_url = base_url
-        self.session = requests.Session()
-        # 设置请求头，模拟浏览器访问
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Referer': 'https://haokan.baidu.com/',
-        })
+        # 传入共享的 Session 可以在多个账号间复用连接，否则单独创建
+        self.session = session or create_session(pool_size=1)
     
     def fetch_author_list(self, ctime: Optional[str] = None, rn: int = 20, 
                          video_type: str = "haokan|tabhubVideo") -> ApiResponse:
@@ -0,0 +1,531 @@
+import fcntl
+import os
+import threading
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from store import LEGACY_FILE_NAME, crawl_file_time, list_data_files, parse_play_count, read_batch
+from segments import (DIMENSION_FILE_NAME, Dimension, Segment, SegmentPart, file_identity, record_info,
+                      record_key, source_signature, to_epoch, write_segment)
+
+SEGMENT_DIR_NAME = "segments"
+LEGACY_SEGMENT_NAME = "seg_legacy"
+
+# 时间序列聚合的桶大小（秒）；周桶以周一 00:00 UTC 为起点（1970-01-01 是周四，偏移 3 天）
+BUCKET_SECONDS = {
+    "hour": 3600,
+    "day": 86400,
+    "week": 604800,
+}
+BUCKET_OFFSETS = {
+    "hour": 0,
+    "day": 0,
+    "week": 3 * 86400,
+}
+TIMESERIES_CACHE_SIZE = 64
+
+
+class Series:
+    """单个视频的完整历史，由若干按时间升序排列的 SegmentPart 拼接而成"""
+
+    __slots__ = ("key", "parts")
+
+    def __init__(self, key: str, parts: List[SegmentPart]):
+        self.key = key
+        self.parts = parts
+
+    @property
+    def info(self) -> Dict:
+        """最新一条记录对应的元数据（app_id / title / publish_time 等）"""
+        return self.parts[-1].info
+
+    def latest(self) -> Tuple[int, int, str]:
+        """返回最新一条记录的 (epoch, play_count, play_count_text)"""
+        part = self.parts[-1]
+        i = len(part) - 1
+        return part.epochs[i], part.plays[i], part.text(i)
+
+    def play_at_or_before(self, epoch: int) -> Optional[int]:
+        """返回时间不晚于 epoch 的最近一条记录的播放量，没有则返回 None"""
+        for part in reversed(self.parts):
+            if part.epochs[0] <= epoch:
+                return part.plays[bisect_right(part.epochs, epoch) - 1]
+        return None
+
+    def points(self) -> Iterator[Tuple[int, int, str]]:
+        """按时间正序遍历 (epoch, play_count, play_count_text)"""
+        for part in self.parts:
+            for i in range(len(part)):
+                yield part.epochs[i], part.plays[i], part.text(i)
+
+
+class _LiveBlock:
+    """尚未封存成段的 json 批次，解析为与段相同的按视频分组的列表"""
+
+    def __init__(self, paths: List[str]):
+        self.parts: Dict[str, SegmentPart] = {}
+        for path in paths:
+            for record in read_batch(path):
+                key = record_key(record)
+                crawl_time = record.get('crawl_time')
+                if not key or not crawl_time:
+                    continue
+                try:
+                    epoch = to_epoch(crawl_time)
+                except ValueError:
+                    continue
+                part = self.parts.get(key)
+                if part is None:
+                    part = self.parts[key] = SegmentPart([], [], None, [], {})
+                part.epochs.append(epoch)
+                part.plays.append(parse_play_count(record.get('play_count', '0')))
+                part.texts.append(record.get('play_count_text') or '')
+                part.info = record_info(record)
+        for part in self.parts.values():
+            part.text_ids = range(len(part.texts))
+            if any(part.epochs[i] > part.epochs[i + 1] for i in range(len(part.epochs) - 1)):
+                order = sorted(range(len(part.epochs)), key=part.epochs.__getitem__)
+                part.epochs = [part.epochs[i] for i in order]
+                part.plays = [part.plays[i] for i in order]
+                part.texts = [part.texts[i] for i in order]
+
+
+def _block_period(name: str) -> str:
+    """段或批次文件所属的时间段（YYYYmm 或 YYYYmmdd），legacy 及无法解析的文件排在最前"""
+    file_time = crawl_file_time(name)
+    if file_time is not None:
+        return file_time.strftime("%Y%m%d")
+    if name.startswith("seg_") and name != LEGACY_SEGMENT_NAME:
+        return name[len("seg_"):]
+    return ""
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class HistorySnapshot:
+    """
+    某一时刻的只读数据视图
+
+    segments 为按时间排序的段（mmap），segment_index 记录每个视频出现在哪些段里，
+    查找时只访问包含该视频的段。live_blocks 为未封存的批次，通常只有当天；
+    已封存的日子里新落地的批次在下一次 seal() 之前也会作为 live 出现，
+    与同一天的段并存，因此拼接历史时按每段的起始时间排序。
+    一次请求内应只使用同一个快照，避免中途看到不同的 generation。
+    """
+
+    def __init__(self, generation: int, dimension: Dimension, segments: List[Segment],
+                 segment_index: Dict[int, List[Segment]], live_blocks: List[_LiveBlock]):
+        self.generation = generation
+        self.dimension = dimension
+        self.segments = segments
+        self.segment_index = segment_index
+        self.live_blocks = live_blocks
+        # 未封存批次中的最新元数据，覆盖维度表中的旧值
+        self.live_info: Dict[str, Dict] = {}
+        for block in live_blocks:
+            for key, part in block.parts.items():
+                self.live_info[key] = part.info
+        keys = dict.fromkeys(dimension.keys)
+        keys.update(dict.fromkeys(self.live_info))
+        self.keys = list(keys)
+        self._indexes = None
+
+    def series(self, key: str) -> Optional[Series]:
+        parts = []
+        key_id = self.dimension.key_ids.get(key)
+        if key_id is not None:
+            info = self.dimension.info[key_id]
+            for segment in self.segment_index.get(key_id, ()):
+                part = segment.part(key_id, info)
+                if part is not None and len(part):
+                    parts.append(part)
+        for block in self.live_blocks:
+            part = block.parts.get(key)
+            if part is not None and len(part):
+                parts.append(part)
+        if not parts:
+            return None
+        # 保证 latest() / play_at_or_before() 依赖的时间顺序
+        parts.sort(key=lambda p: p.epochs[0])
+        return Series(key, parts)
+
+    def iter_series(self) -> Iterator[Series]:
+        """遍历所有视频的历史"""
+        for key in self.keys:
+            series = self.series(key)
+            if series is not None:
+                yield series
+
+    def indexes(self) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        """按标题、按账号的索引：复用维度表的索引，只对未封存批次中的视频做增量修正"""
+        if self._indexes is None:
+            base_title, base_app = self.dimension.indexes()
+            by_title, by_app = dict(base_title), dict(base_app)
+            copied = set()
+
+            def writable(index, name, value):
+                # 写时复制，不改动维度表上缓存的列表
+                if (name, value) not in copied:
+                    index[value] = list(index.get(value, []))
+                    copied.add((name, value))
+                return index[value]
+
+            for key, info in self.live_info.items():
+                key_id = self.dimension.key_ids.get(key)
+                old = self.dimension.info[key_id] if key_id is not None else None
+                if old is not None and old.get('app_id') == info.get('app_id') \
+                        and old.get('title') == info.get('title'):
+                    continue
+                if old is not None:
+                    writable(by_app, "app", old.get('app_id')).remove(key)
+                    if old.get('title'):
+                        writable(by_title, "title", old['title']).remove(key)
+                writable(by_app, "app", info.get('app_id')).append(key)
+                if info.get('title'):
+                    writable(by_title, "title", info['title']).append(key)
+            self._indexes = (by_title, by_app)
+        return self._indexes
+
+    def find(self, vid_or_title: str) -> List[Series]:
+        """按 vid 或标题查找视频"""
+        by_title, _ = self.indexes()
+        keys = dict.fromkeys([vid_or_title] + by_title.get(vid_or_title, []))
+        return [s for s in (self.series(k) for k in keys) if s is not None]
+
+    def account_series(self, app_id: str) -> List[Series]:
+        """某个账号下的所有视频（按视频最新记录的 app_id 归属）"""
+        _, by_app = self.indexes()
+        return [s for s in (self.series(k) for k in by_app.get(app_id, [])) if s is not None]
+
+
+class HistoryStore:
+    """
+    历史数据读取层
+
+    已结束的 UTC 自然日的批次被封存为只读段并以 mmap 方式读取，已结束的自然月再合并为月段；
+    当天的批次仍按 json 解析。每次数据文件发生变化生成新的快照，generation 加一，
+    可作为上层缓存的失效依据。打开的段、维度表和解析过的批次在快照之间复用。
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.segment_dir = os.path.join(data_dir, SEGMENT_DIR_NAME)
+        self.dimension_path = os.path.join(self.segment_dir, DIMENSION_FILE_NAME)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._live_paths: List[str] = []
+        self._dimension = (None, Dimension([], [], []))
+        # 段名 -> ((.bin 标识, .json 标识), Segment 或 None)
+        self._segment_cache: Dict[str, Tuple] = {}
+        # 时间段 -> (批次签名, _LiveBlock)
+        self._live_cache: Dict[str, Tuple] = {}
+        self._snapshot = HistorySnapshot(0, self._dimension[1], [], {}, [])
+        self._timeseries_cache: Dict[Tuple, Dict] = {}
+
+    @property
+    def generation(self) -> int:
+        return self._snapshot.generation
+
+    def seal(self) -> int:
+        """
+        将 legacy records.json 及今天之前的批次封存为段，返回新写入的段数量
+
+        本月的批次按天封存；之前月份的批次合并为月段，并删除对应的日段，
+        这样段的数量不会随保留天数无限增长。
+        """
+        os.makedirs(self.segment_dir, exist_ok=True)
+        # 多个 worker / 爬取任务可能同时封存，用文件锁串行化
+        with open(os.path.join(self.segment_dir, ".lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                return self._seal_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _seal_locked(self) -> int:
+        groups: Dict[str, List[str]] = {}
+        now = datetime.utcnow()
+        today, this_month = now.strftime("%Y%m%d"), now.strftime("%Y%m")
+        for path in list_data_files(self.data_dir):
+            if os.path.basename(path) == LEGACY_FILE_NAME:
+                groups.setdefault(LEGACY_SEGMENT_NAME, []).append(path)
+                continue
+            file_time = crawl_file_time(path)
+            if file_time is None:
+                continue
+            day, month = file_time.strftime("%Y%m%d"), file_time.strftime("%Y%m")
+            if month < this_month:
+                groups.setdefault(f"seg_{month}", []).append(path)
+            elif day < today:
+                groups.setdefault(f"seg_{day}", []).append(path)
+
+        dimension = Dimension.load(self.dimension_path)
+        written = 0
+        for name, paths in sorted(groups.items()):
+            segment_path = os.path.join(self.segment_dir, name)
+            if not self._segment_matches(segment_path, paths, dimension):
+                write_segment(segment_path, paths, dimension, self.dimension_path)
+                written += 1
+
+        # 已合并进月段的日段不再需要
+        for file_name in os.listdir(self.segment_dir):
+            base, ext = os.path.splitext(file_name)
+            if ext in (".bin", ".json") and base.startswith("seg_") and len(base) == len("seg_YYYYmmdd") \
+                    and f"seg_{base[4:10]}" in groups:
+                os.remove(os.path.join(self.segment_dir, file_name))
+        return written
+
+    def _segment_matches(self, segment_path: str, paths: List[str], dimension: Dimension) -> bool:
+        """段存在、格式有效、源文件未变化且引用的视频都在维度表中时无需重写"""
+        try:
+            segment = Segment(segment_path)
+        except (OSError, ValueError, KeyError):
+            return False
+        if segment.max_key_id >= len(dimension.keys):
+            return False
+        try:
+            return segment.sources == [tuple(source_signature(p)) for p in paths]
+        except OSError:
+            return False
+
+    def _quick_signature(self, live_paths: List[str]):
+        """
+        低开销的变化检测：两个目录的 mtime 加上未封存批次的签名
+
+        新增/替换文件会改变目录 mtime；已封存的源文件不再逐个 stat，
+        它们被修改时由下一次 seal() 重写对应的段，同样会改变段目录的 mtime。
+        """
+        try:
+            live = tuple(tuple(source_signature(p)) for p in live_paths)
+        except OSError:
+            return None
+        return _mtime_ns(self.data_dir), _mtime_ns(self.segment_dir), live
+
+    def _load_dimension(self, force: bool = False) -> Dimension:
+        identity = file_identity(self.dimension_path)
+        if force or identity != self._dimension[0]:
+            self._dimension = (identity, Dimension.load(self.dimension_path))
+        return self._dimension[1]
+
+    def _open_segments(self, dimension: Dimension) -> Tuple[List[Segment], Dimension]:
+        """打开段目录下的段，未变化的段直接复用；新打开的段校验一次源文件"""
+        names = []
+        if os.path.isdir(self.segment_dir):
+            names = [n[:-len(".json")] for n in os.listdir(self.segment_dir)
+                     if n.startswith("seg_") and n.endswith(".json")]
+        # 月段排在其日段之前（"seg_202610" < "seg_20261001"），重叠时以月段为准
+        names.sort(key=lambda n: (n != LEGACY_SEGMENT_NAME, n))
+
+        cache = {}
+        segments = []
+        covered = set()
+        for name in names:
+            path = os.path.join(self.segment_dir, name)
+            identity = (file_identity(path + ".bin"), file_identity(path + ".json"))
+            cached = self._segment_cache.get(name)
+            if cached is not None and cached[0] == identity:
+                segment = cached[1]
+            else:
+                try:
+                    segment = Segment(path)
+                except (OSError, ValueError, KeyError):
+                    # 可能正在被替换，不缓存，下次刷新重试
+                    continue
+                # 源文件已变化的段不再可信，回退到直接读取 json
+                if not segment.sources_match(self.data_dir):
+                    segment = None
+            cache[name] = (identity, segment)
+            if segment is None or segment.source_names & covered:
+                continue
+            if segment.max_key_id >= len(dimension.keys):
+                # 维度表比段旧（两者之间刚好发生了替换），重新读取一次
+                dimension = self._load_dimension(force=True)
+                if segment.max_key_id >= len(dimension.keys):
+                    continue
+            segments.append(segment)
+            covered |= segment.source_names
+        self._segment_cache = cache
+        return segments, dimension
+
+    def refresh(self):
+        """数据文件有变化时更新快照：只重新打开变化的段、只重新解析变化的批次"""
+        if self._signature is not None and self._quick_signature(self._live_paths) == self._signature:
+            return
+
+        with self._lock:
+            if self._signature is not None and self._quick_signature(self._live_paths) == self._signature:
+                return
+            # 先取目录 mtime 再列目录，期间发生的变化会在下一次刷新时被发现
+            dir_times = (_mtime_ns(self.data_dir), _mtime_ns(self.segment_dir))
+            dimension = self._load_dimension()
+            segments, dimension = self._open_segments(dimension)
+            covered = set()
+            for segment in segments:
+                covered |= segment.source_names
+
+            # 未封存的批次按自然日分组，未变化的分组直接复用上次的解析结果
+            live_paths = []
+            live_signatures = []
+            live_groups: Dict[str, List] = {}
+            for path in list_data_files(self.data_dir):
+                name = os.path.basename(path)
+                if name in covered:
+                    continue
+                try:
+                    signature = tuple(source_signature(path))
+                except OSError:
+                    continue
+                live_paths.append(path)
+                live_signatures.append(signature)
+                live_groups.setdefault(_block_period(name), []).append((path, signature))
+            live_cache = {}
+            for period, entries in sorted(live_groups.items()):
+                group_signature = tuple(signature for _, signature in entries)
+                cached = self._live_cache.get(period)
+                if cached is None or cached[0] != group_signature:
+                    cached = (group_signature, _LiveBlock([path for path, _ in entries]))
+                live_cache[period] = cached
+            self._live_cache = live_cache
+
+            # 段集合和维度表都没变时（例如只新增了一个批次）复用上一个快照的段索引
+            previous = self._snapshot
+            if previous.dimension is dimension and len(previous.segments) == len(segments) \
+                    and all(a is b for a, b in zip(previous.segments, segments)):
+                segment_index = previous.segment_index
+            else:
+                segment_index: Dict[int, List[Segment]] = {}
+                for segment in segments:
+                    for key_id in segment.key_ids.tolist():
+                        segment_index.setdefault(key_id, []).append(segment)
+
+            self._live_paths = live_paths
+            self._signature = (dir_times[0], dir_times[1], tuple(live_signatures))
+            self._snapshot = HistorySnapshot(self.generation + 1, dimension, segments, segment_index,
+                                             [block for _, block in live_cache.values()])
+
+    def snapshot(self) -> HistorySnapshot:
+        """刷新后返回当前快照"""
+        self.refresh()
+        return self._snapshot
+
+    def warm(self):
+        """预热：打开段、解析未封存批次、构建索引，并提示内核预读段文件"""
+        snapshot = self.snapshot()
+        for segment in snapshot.segments:
+            segment.prefetch()
+        snapshot.indexes()
+
+    def series(self, key: str) -> Optional[Series]:
+        return self.snapshot().series(key)
+
+    def iter_series(self) -> Iterator[Series]:
+        return self.snapshot().iter_series()
+
+    def find(self, vid_or_title: str) -> List[Series]:
+        return self.snapshot().find(vid_or_title)
+
+    def account_series(self, app_id: str) -> List[Series]:
+        return self.snapshot().account_series(app_id)
+
+    def timeseries(self, app_ids: List[str], bucket: str) -> Dict:
+        """
+        多账号按时间桶聚合的播放量序列
+
+        对每个视频只顺序扫描一遍历史：视频在某个桶内的播放量取桶内最后一条记录，
+        没有记录的桶沿用之前的值，这样漏爬的小时不会让总量出现断崖。
+        每个桶只记录相对上一个桶的变化量，最后做一次前缀和得到总量。
+        结果按 (账号集合, 桶大小, generation) 缓存。
+
+        Args:
+            app_ids: 账号 ID 列表
+            bucket: hour / day / week
+
+        Returns:
+            Dict: {"generation": int, "buckets": [epoch...], "accounts": {app_id: 序列}, "total": 序列}，
+            序列为 {"play_count": [...], "growth": [...], "video_count": [...]}，与 buckets 一一对应
+            growth 为桶内的播放增长：已有视频按相对上一个桶末的变化计，
+            桶内新出现的视频只计其首条记录之后的增长
+        """
+        size = BUCKET_SECONDS[bucket]
+        offset = BUCKET_OFFSETS[bucket]
+        snapshot = self.snapshot()
+        # generation 取自同一个快照，避免把旧数据的结果缓存到新 generation 下
+        cache_key = (frozenset(app_ids), bucket, snapshot.generation)
+        with self._lock:
+            cached = self._timeseries_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        _, by_app = snapshot.indexes()
+        # 每个账号：桶 -> [总量变化, 新视频首条记录的播放量, 新视频数]
+        deltas: Dict[str, Dict[int, List[int]]] = {}
+        for app_id in dict.fromkeys(app_ids):
+            app_deltas = deltas[app_id] = {}
+            for key in by_app.get(app_id, []):
+                series = snapshot.series(key)
+                if series is None:
+                    continue
+                emitted = 0
+                current_bucket = None
+                current_play = 0
+                for part in series.parts:
+                    epochs, plays = part.epochs, part.plays
+                    for i in range(len(epochs)):
+                        b = (epochs[i] + offset) // size
+                        if b != current_bucket:
+                            if current_bucket is None:
+                                entry = app_deltas.setdefault(b, [0, 0, 0])
+                                entry[1] += plays[i]
+                                entry[2] += 1
+                            else:
+                                app_deltas.setdefault(current_bucket, [0, 0, 0])[0] += current_play - emitted
+                                emitted = current_play
+                            current_bucket = b
+                        current_play = plays[i]
+                if current_bucket is not None:
+                    app_deltas.setdefault(current_bucket, [0, 0, 0])[0] += current_play - emitted
+
+        all_buckets = [b for app_deltas in deltas.values() for b in app_deltas]
+        result = {
+            "generation": snapshot.generation,
+            "buckets": [],
+            # 没有数据的账号同样返回空序列
+            "accounts": {app_id: {"play_count": [], "growth": [], "video_count": []} for app_id in deltas},
+            "total": {"play_count": [], "growth": [], "video_count": []},
+        }
+        if all_buckets:
+            first, last = min(all_buckets), max(all_buckets)
+            result["buckets"] = [b * size - offset for b in range(first, last + 1)]
+            for app_id, app_deltas in deltas.items():
+                play_count, growth, video_count = [], [], []
+                total = 0
+                videos = 0
+                for b in range(first, last + 1):
+                    change, initial, new_videos = app_deltas.get(b, (0, 0, 0))
+                    total += change
+                    videos += new_videos
+                    play_count.append(total)
+                    growth.append(change - initial)
+                    video_count.append(videos)
+                result["accounts"][app_id] = {
+                    "play_count": play_count,
+                    "growth": growth,
+                    "video_count": video_count,
+                }
+            for name in ("play_count", "growth", "video_count"):
+                result["total"][name] = [sum(values) for values in
+                                         zip(*(acc[name] for acc in result["accounts"].values()))]
+
+        # 只保留当前 generation 的结果
+        with self._lock:
+            if any(k[2] != snapshot.generation for k in self._timeseries_cache) \
+                    or len(self._timeseries_cache) >= TIMESERIES_CACHE_SIZE:
+                self._timeseries_cache = {}
+            self._timeseries_cache[cache_key] = result
+        return result
@@ -1,14 +1,119 @@
+import fcntl
 import json
 import os
 import time
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from threading import Thread
+from typing import List, Dict, Any, Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from apscheduler.schedulers.background import BackgroundScheduler
-from haokan_crawler import HaokanCrawler
+from haokan_crawler import HaokanCrawler, create_session
+from store import iter_records
+from exporter import EXPORT_FORMATS, export_records, format_available
+from history import BUCKET_SECONDS, HistoryStore, Series
+from segments import from_epoch
 
-app = FastAPI(title="Haokan Video Monitor")
+# 路径配置
+DATA_DIR = "/app/data"
+CONFIG_FILE = "/app/config/accounts.json"
+DATA_FILE = "/app/data/records.json" # Legacy path, will also read from glob
+
+# 同时爬取的账号数，也是上游连接池的大小
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "4"))
+
+# 数据层是惰性的：构造时不做任何 IO，首次访问或启动预热时才打开段和解析批次
+history = HistoryStore(DATA_DIR)
+
+# 调度器在 lifespan 中创建，import 本模块不会产生副作用
+scheduler: Optional[BackgroundScheduler] = None
+
+# 最近一次爬取的上游连接统计（DNS / 连接 / TLS 耗时、连接复用次数）。
+# 只有持有调度器的 worker 会爬取，因此写到数据目录下供所有 worker 读取
+UPSTREAM_STATS_FILE = os.path.join(DATA_DIR, ".upstream_stats.json")
+
+# 启动状态：进程存活（/）与缓存预热完成（/api/ready）分开上报
+startup_state = {
+    "started_at": None,
+    "ready_at": None,
+    "warmup_seconds": None,
+    "error": None,
+}
+
+# 预热重试次数与首次重试间隔（秒，之后每次翻倍）
+WARMUP_RETRIES = 5
+WARMUP_BACKOFF = 2
+
+# 是否允许本进程运行定时爬取；多 worker 时还会通过文件锁保证只有一个进程持有调度器
+RUN_SCHEDULER = os.environ.get("RUN_SCHEDULER", "1") != "0"
+SCHEDULER_LOCK_FILE = os.path.join(DATA_DIR, ".scheduler.lock")
+
+def warm_up():
+    """
+    后台预热：封存历史段、映射段文件并构建索引，完成后才报告 ready
+
+    失败时按指数退避重试；全部失败后仍报告 ready 并记录错误，
+    此时数据层在请求到来时惰性刷新，只是首个请求会慢一些。
+    """
+    begin = time.monotonic()
+    for attempt in range(WARMUP_RETRIES):
+        try:
+            history.seal()
+            history.warm()
+            startup_state["error"] = None
+            break
+        except Exception as e:
+            startup_state["error"] = str(e)
+            print(f"[{datetime.now()}] Warm-up failed (Attempt {attempt + 1}/{WARMUP_RETRIES}): {e}")
+            if attempt < WARMUP_RETRIES - 1:
+                time.sleep(WARMUP_BACKOFF * 2 ** attempt)
+    startup_state["warmup_seconds"] = round(time.monotonic() - begin, 3)
+    startup_state["ready_at"] = datetime.now()
+    print(f"[{datetime.now()}] Warm-up finished in {startup_state['warmup_seconds']}s "
+          f"(generation {history.generation}, error: {startup_state['error']}).")
+
+def acquire_scheduler_lock():
+    """尝试获取调度器文件锁，成功返回持有锁的文件对象（进程存活期间保持打开），否则返回 None"""
+    lock_file = open(SCHEDULER_LOCK_FILE, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global scheduler
+    startup_state["started_at"] = datetime.now()
+
+    # 确保数据目录存在
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    # 启动调度器：多个 uvicorn worker 中只有拿到文件锁的那一个运行定时爬取
+    scheduler_lock = acquire_scheduler_lock() if RUN_SCHEDULER else None
+    if scheduler_lock is not None:
+        scheduler = BackgroundScheduler()
+        # 每小时整点触发 (minute='0')
+        scheduler.add_job(crawl_job, 'cron', minute='0')
+        scheduler.start()
+        print(f"[{datetime.now()}] Scheduler started in process {os.getpid()}.")
+
+    Thread(target=warm_up, daemon=True).start()
+    yield
+
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+        scheduler = None
+    if scheduler_lock is not None:
+        scheduler_lock.close()
+
+app = FastAPI(title="Haokan Video Monitor", lifespan=lifespan)
 
 # 配置 CORS
 app.add_middleware(
@@ -19,46 +124,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 路径配置
-CONFIG_FILE = "/app/config/accounts.json"
-DATA_FILE = "/app/data/records.json"
-
-import glob
-
-DATA_DIR = "/app/data"
-CONFIG_FILE = "/app/config/accounts.json"
-DATA_FILE = "/app/data/records.json" # Legacy path, will also read from glob
-
-# 确保数据目录存在
-os.makedirs(DATA_DIR, exist_ok=True)
-
-def load_data() -> List[Dict]:
-    """读取 data 目录下所有的 json 文件并合并"""
-    all_data = []
-    
-    # 1. 读取 legacy records.json
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    all_data.extend(data)
-        except:
-            pass
-
-    # 2. 读取新格式的 crawl_*.json
-    json_files = glob.glob(os.path.join(DATA_DIR, "crawl_*.json"))
-    for file_path in json_files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    all_data.extend(data)
-        except:
-            pass
-            
-    return all_data
-
 def save_crawl_batch(data: List[Dict]):
     """将本次爬取的数据保存为独立文件"""
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
@@ -84,17 +149,56 @@ def load_accounts() -> List[Dict]:
     except:
         return []
 
-def parse_play_count(play_count_str: str) -> int:
-    """解析播放量字符串为整数"""
+def crawl_account(account: Dict, session, crawl_time: str) -> List[Dict]:
+    """爬取单个账号的所有视频，失败时重试"""
+    app_id = account['id']
+    records = []
+    # 重试机制
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            print(f"Crawling account: {app_id} (Attempt {attempt + 1}/{max_retries})")
+            crawler = HaokanCrawler(app_id=app_id, session=session)
+            # 获取该账号的所有视频
+            videos = crawler.get_video_info_list()
+            
+            for video in videos:
+                # 添加元数据
+                record = video.copy()
+                record['app_id'] = app_id
+                record['author_name'] = account.get('name', '') # 添加作者昵称
+                record['crawl_time'] = crawl_time
+                record['vid'] = video.get('vid', '') # 确保有vid
+                
+                records.append(record)
+            
+            # 如果成功，跳出重试循环
+            break
+            
+        except Exception as e:
+            print(f"Error crawling {app_id}: {e}")
+            records = []
+            if attempt < max_retries - 1:
+                time.sleep(5) # 等待5秒后重试
+            else:
+                print(f"Failed to crawl {app_id} after {max_retries} attempts.")
+    return records
+
+def save_upstream_stats(stats: Dict):
+    """原子写入上游连接统计"""
+    tmp_path = f"{UPSTREAM_STATS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, UPSTREAM_STATS_FILE)
+
+def load_upstream_stats() -> Optional[Dict]:
+    if not os.path.exists(UPSTREAM_STATS_FILE):
+        return None
     try:
-        if not play_count_str:
-            return 0
-        # 处理可能带有的单位（虽然通常API返回纯数字）
-        if '万' in play_count_str:
-            return int(float(play_count_str.replace('万', '')) * 10000)
-        return int(play_count_str)
+        with open(UPSTREAM_STATS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except:
-        return 0
+        return None
 
 def crawl_job():
     print(f"[{datetime.now()}] Starting scheduled crawl job...")
@@ -107,62 +211,128 @@ def crawl_job():
     
     session_records = []
     
-    for account in accounts_list:
-        app_id = account['id']
-        # 重试机制
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                print(f"Crawling account: {app_id} (Attempt {attempt + 1}/{max_retries})")
-                crawler = HaokanCrawler(app_id=app_id)
-                # 获取该账号的所有视频
-                videos = crawler.get_video_info_list()
-                
-                for video in videos:
-                    # 添加元数据
-                    record = video.copy()
-                    record['app_id'] = app_id
-                    record['author_name'] = account.get('name', '') # 添加作者昵称
-                    record['crawl_time'] = current_crawl_time
-                    record['vid'] = video.get('vid', '') # 确保有vid
-                    
-                    session_records.append(record)
-                
-                # 如果成功，跳出重试循环
-                break
-                
-            except Exception as e:
-                print(f"Error crawling {app_id}: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(5) # 等待5秒后重试
-                else:
-                    print(f"Failed to crawl {app_id} after {max_retries} attempts.")
+    # 所有账号共享一个 Session，连接池大小与并发数一致，TCP/TLS 连接在账号之间复用
+    session = create_session(pool_size=CRAWL_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=CRAWL_CONCURRENCY) as executor:
+        for records in executor.map(lambda acc: crawl_account(acc, session, current_crawl_time), accounts_list):
+            session_records.extend(records)
+    session.close()
+
+    upstream_stats = session.upstream_stats.snapshot()
+    upstream_stats["crawl_time"] = current_crawl_time
+    print(f"Upstream connections: {upstream_stats}")
+    save_upstream_stats(upstream_stats)
 
     if session_records:
         save_crawl_batch(session_records)
         print(f"Saved {len(session_records)} records.")
+
+    # 把已结束的自然日封存为只读段
+    sealed = history.seal()
+    if sealed:
+        print(f"Sealed {sealed} history segments.")
     
     print(f"[{datetime.now()}] Crawl job finished.")
 
-# 启动调度器
-scheduler = BackgroundScheduler()
-# 每小时整点触发 (minute='0')
-scheduler.add_job(crawl_job, 'cron', minute='0')
-scheduler.start()
-
 @app.get("/")
 def root():
     return {"status": "running", "time": datetime.now()}
 
+@app.get("/api/ready")
+def ready():
+    """就绪检查：缓存预热完成前返回 503"""
+    body = {
+        "ready": startup_state["ready_at"] is not None,
+        "started_at": startup_state["started_at"],
+        "ready_at": startup_state["ready_at"],
+        "warmup_seconds": startup_state["warmup_seconds"],
+        "generation": history.generation,
+        "error": startup_state["error"],
+        "scheduler": scheduler is not None,
+    }
+    return JSONResponse(jsonable_encoder(body), status_code=200 if body["ready"] else 503)
+
 @app.get("/api/data")
 def get_data(limit: int = 100):
-    data = load_data()
-    return data[:limit]
+    return list(islice(iter_records(DATA_DIR), limit))
+
+def parse_time_param(value: Optional[str], name: str, end_of_day: bool = False) -> Optional[datetime]:
+    """
+    解析查询参数中的时间，统一转为与 crawl_time 一致的 naive UTC
+
+    支持 2024-01-01、2024-01-01 12:00:00 以及带时区偏移的写法（如 +08:00，会换算成 UTC）。
+    end_of_day 为 True 时，只写日期表示当天的最后一秒。
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} 时间格式错误: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if end_of_day and len(value) == len("2024-01-01"):
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed
+
+@app.get("/api/export")
+def export_data(format: str = "csv",
+                app_ids: Optional[str] = None,
+                vids: Optional[str] = None,
+                start: Optional[str] = None,
+                end: Optional[str] = None):
+    """
+    批量导出历史快照，供离线分析使用
+
+    - format: csv / arrow / parquet（arrow / parquet 需要另行安装可选依赖 pyarrow，未安装时返回 501）
+    - app_ids, vids: 逗号分隔的过滤条件
+    - start, end: crawl_time 范围（UTC，含两端；只写日期的 end 包含当天全天）
+
+    数据逐文件读取并分块编码后以 chunked 方式返回，不会在内存中构建完整列表。
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+    if not format_available(format):
+        raise HTTPException(status_code=501, detail=f"{format} 导出需要安装 pyarrow")
+
+    # 参数在开始流式输出之前校验，错误直接返回 400 而不是中断下载
+    start_time = parse_time_param(start, "start")
+    end_time = parse_time_param(end, "end", end_of_day=True)
+    records = iter_records(
+        DATA_DIR,
+        start=start_time,
+        end=end_time,
+        app_ids=[a for a in app_ids.split(',') if a] if app_ids else None,
+        vids=[v for v in vids.split(',') if v] if vids else None,
+    )
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"haokan_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return StreamingResponse(
+        export_records(records, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# 增长窗口：距最新一条记录至少多少秒（留有余量，兼容整点爬取的时间抖动）
+GROWTH_WINDOWS = {
+    "hour": 3000,
+    "day": 80000,
+    "two_days": 166000,
+    "week": 600000,
+    "month": 2500000,
+}
+
+def series_snapshots(series: Series) -> Dict[str, Optional[int]]:
+    """取视频最新播放量及各增长窗口起点的播放量（没有足够历史时为 None）"""
+    latest_epoch, latest_play, _ = series.latest()
+    snapshots = {"latest": latest_play}
+    for name, seconds in GROWTH_WINDOWS.items():
+        snapshots[name] = series.play_at_or_before(latest_epoch - seconds)
+    return snapshots
 
 @app.get("/api/stats/dashboard")
 def get_dashboard_stats():
     """获取全局数据总览"""
-    all_records = load_data()
     accounts = load_accounts()
     
     # 全局汇总数据
@@ -180,15 +350,8 @@ def get_dashboard_stats():
     # 账号维度列表数据
     accounts_stats = []
 
-    # 整理所有视频数据 {vid: [records]}
-    all_videos_map = {}
-    for record in all_records:
-        vid = record.get('vid') or record.get('title')
-        if vid not in all_videos_map:
-            all_videos_map[vid] = []
-        all_videos_map[vid].append(record)
-
-    current_time = datetime.now()
+    # 整个请求使用同一个数据快照
+    snapshot = history.snapshot()
 
     # 计算每个账号的指标
     for acc in accounts:
@@ -204,84 +367,40 @@ def get_dashboard_stats():
         
         acc_total_play = 0
         
-        # 找出属于该账号的视频
-        # 优化：可以在一次遍历中做，但为了逻辑清晰分开写
-        # 这里假设 all_videos_map 中的视频可以通过 app_id 关联（record里有）
-        
-        for vid, records in all_videos_map.items():
-            # 检查这个视频是否属于该账号（取最新记录判断）
-            if not records or records[0].get('app_id') != app_id:
-                continue
-                
-            records.sort(key=lambda x: x['crawl_time'], reverse=True)
-            latest = records[0]
-            latest_play = parse_play_count(latest.get('play_count', '0'))
-            latest_time = datetime.strptime(latest['crawl_time'], "%Y-%m-%d %H:%M:%S")
+        for series in snapshot.account_series(app_id):
+            snap = series_snapshots(series)
+            latest_play = snap["latest"]
             
             acc_stats["video_count"] += 1
             acc_total_play += latest_play
             
-            # 寻找历史记录
-            one_hour_ago = None
-            one_day_ago = None     # 24h ago
-            two_days_ago = None    # 48h ago (for yesterday growth)
-            seven_days_ago = None  # Last Week
-            thirty_days_ago = None # Last Month
-            
-            for rec in records:
-                rec_time = datetime.strptime(rec['crawl_time'], "%Y-%m-%d %H:%M:%S")
-                diff_seconds = (latest_time - rec_time).total_seconds()
-                
-                # 1 hour (allow some margin, e.g. 50 mins to 70 mins)
-                if diff_seconds >= 3000 and one_hour_ago is None:
-                    one_hour_ago = rec
-                
-                # 24 hours
-                if diff_seconds >= 80000 and one_day_ago is None:
-                    one_day_ago = rec
-                
-                # 48 hours
-                if diff_seconds >= 166000 and two_days_ago is None:
-                    two_days_ago = rec
-                
-                # 7 days
-                if diff_seconds >= 600000 and seven_days_ago is None:
-                    seven_days_ago = rec
-                
-                # 30 days
-                if diff_seconds >= 2500000 and thirty_days_ago is None:
-                    thirty_days_ago = rec
-            
             # 计算增长
-            if one_hour_ago:
-                g = latest_play - parse_play_count(one_hour_ago.get('play_count', '0'))
+            if snap["hour"] is not None:
+                g = latest_play - snap["hour"]
                 acc_stats["hour_growth"] += g
                 global_stats["hour_growth"] += g
                 
-            if one_day_ago:
-                day_play = parse_play_count(one_day_ago.get('play_count', '0'))
-                g = latest_play - day_play
+            if snap["day"] is not None:
+                g = latest_play - snap["day"]
                 acc_stats["day_growth"] += g
                 global_stats["day_growth"] += g
                 
                 # Yesterday Total (Snapshot at 24h ago)
-                global_stats["yesterday_total"] += day_play
+                global_stats["yesterday_total"] += snap["day"]
                 
             # Yesterday Growth = (Value at 24h ago) - (Value at 48h ago)
-            if one_day_ago and two_days_ago:
-                day_play = parse_play_count(one_day_ago.get('play_count', '0'))
-                two_day_play = parse_play_count(two_days_ago.get('play_count', '0'))
-                g = day_play - two_day_play
+            if snap["day"] is not None and snap["two_days"] is not None:
+                g = snap["day"] - snap["two_days"]
                 acc_stats["yesterday_growth"] += g
                 global_stats["yesterday_growth"] += g
             
             # Last Week Total
-            if seven_days_ago:
-                global_stats["last_week_total"] += parse_play_count(seven_days_ago.get('play_count', '0'))
+            if snap["week"] is not None:
+                global_stats["last_week_total"] += snap["week"]
             
             # Last Month Total
-            if thirty_days_ago:
-                global_stats["last_month_total"] += parse_play_count(thirty_days_ago.get('play_count', '0'))
+            if snap["month"] is not None:
+                global_stats["last_month_total"] += snap["month"]
                 
         
         acc_stats["total_play_count"] = acc_total_play
@@ -297,87 +416,57 @@ def get_dashboard_stats():
 @app.get("/api/stats/account/{target_app_id}")
 def get_account_details(target_app_id: str):
     """获取指定账号的详细视频列表及增长数据"""
-    all_records = load_data()
     accounts = load_accounts()
     
     # 获取账号名称
     account_info = next((a for a in accounts if a['id'] == target_app_id), None)
     account_name = account_info.get('name', f"用户_{target_app_id}") if account_info else target_app_id
 
-    # 过滤该账号的记录
-    account_records = [r for r in all_records if r.get('app_id') == target_app_id]
+    account_series = history.snapshot().account_series(target_app_id)
     
-    if not account_records:
+    if not account_series:
         return {
             "info": {"id": target_app_id, "name": account_name},
             "stats": {"hour_growth": 0, "day_growth": 0, "yesterday_growth": 0},
             "videos": []
         }
         
-    # 按 vid 分组
-    videos_map = {}
-    for record in account_records:
-        vid = record.get('vid') or record.get('title')
-        if vid not in videos_map:
-            videos_map[vid] = []
-        videos_map[vid].append(record)
-        
     video_list = []
     total_hour_growth = 0
     total_day_growth = 0
     total_yesterday_growth = 0
     
-    for vid, records in videos_map.items():
-        records.sort(key=lambda x: x['crawl_time'], reverse=True)
-        latest = records[0]
-        latest_play = parse_play_count(latest.get('play_count', '0'))
-        latest_time = datetime.strptime(latest['crawl_time'], "%Y-%m-%d %H:%M:%S")
+    for series in account_series:
+        latest_epoch, latest_play, latest_text = series.latest()
+        snap = series_snapshots(series)
         
         hour_growth = 0
         day_growth = 0
         yesterday_growth = 0
         
-        # 计算增长
-        one_hour_ago = None
-        one_day_ago = None
-        two_days_ago = None
-        
-        for rec in records:
-            rec_time = datetime.strptime(rec['crawl_time'], "%Y-%m-%d %H:%M:%S")
-            diff = (latest_time - rec_time).total_seconds()
-            
-            if diff >= 3000 and one_hour_ago is None:
-                one_hour_ago = rec
-            if diff >= 80000 and one_day_ago is None:
-                one_day_ago = rec
-            if diff >= 166000 and two_days_ago is None:
-                two_days_ago = rec
-                
-        if one_hour_ago:
-            hour_growth = latest_play - parse_play_count(one_hour_ago.get('play_count', '0'))
+        if snap["hour"] is not None:
+            hour_growth = latest_play - snap["hour"]
             
-        if one_day_ago:
-            day_val = parse_play_count(one_day_ago.get('play_count', '0'))
-            day_growth = latest_play - day_val
+        if snap["day"] is not None:
+            day_growth = latest_play - snap["day"]
             
-            if two_days_ago:
-                two_day_val = parse_play_count(two_days_ago.get('play_count', '0'))
-                yesterday_growth = day_val - two_day_val
+            if snap["two_days"] is not None:
+                yesterday_growth = snap["day"] - snap["two_days"]
             
         total_hour_growth += hour_growth
         total_day_growth += day_growth
         total_yesterday_growth += yesterday_growth
         
         video_info = {
-            "vid": vid,
-            "title": latest.get('title'),
-            "publish_time": latest.get('publish_time'),
+            "vid": series.key,
+            "title": series.info.get('title'),
+            "publish_time": series.info.get('publish_time'),
             "play_count": latest_play,
-            "play_count_text": latest.get('play_count_text'),
+            "play_count_text": latest_text,
             "hour_growth": hour_growth,
             "day_growth": day_growth,
             "yesterday_growth": yesterday_growth,
-            "crawl_time": latest.get('crawl_time')
+            "crawl_time": from_epoch(latest_epoch)
         }
         video_list.append(video_info)
         
@@ -394,39 +483,78 @@ def get_account_details(target_app_id: str):
         "videos": video_list
     }
 
+@app.get("/api/stats/timeseries")
+def get_timeseries(app_ids: Optional[str] = None, bucket: str = "day"):
+    """
+    多账号聚合时间序列
+
+    - app_ids: 逗号分隔的账号 ID，不传则为所有已配置账号
+    - bucket: hour / day / week（UTC）
+
+    返回每个桶的合计播放量与增长，以及各账号各自的序列，便于对比。
+    """
+    if bucket not in BUCKET_SECONDS:
+        raise HTTPException(status_code=400, detail=f"不支持的时间桶: {bucket}")
+
+    accounts = load_accounts()
+    names = {a['id']: a.get('name', f"用户_{a['id']}") for a in accounts}
+    if app_ids:
+        ids = list(dict.fromkeys(a for a in app_ids.split(',') if a))
+    else:
+        ids = [a['id'] for a in accounts]
+
+    result = history.timeseries(ids, bucket)
+    times = [from_epoch(epoch) for epoch in result["buckets"]]
+
+    def points(series: Dict) -> List[Dict]:
+        return [
+            {"time": t, "play_count": p, "growth": g, "video_count": v}
+            for t, p, g, v in zip(times, series["play_count"], series["growth"], series["video_count"])
+        ]
+
+    return {
+        "bucket": bucket,
+        "generation": result["generation"],
+        "total": points(result["total"]),
+        "accounts": [
+            {"app_id": app_id, "name": names.get(app_id, app_id), "points": points(result["accounts"][app_id])}
+            for app_id in ids
+        ],
+    }
+
 @app.get("/api/stats/video/{vid_or_title}")
 def get_video_history(vid_or_title: str):
     """获取单个视频的历史趋势数据"""
-    all_records = load_data()
-    
-    # 查找匹配的记录
     # 注意：vid 在 URL 中可能需要编码，这里假设是安全的字符串
-    history = []
-    for r in all_records:
-        if r.get('vid') == vid_or_title or r.get('title') == vid_or_title:
-            history.append({
-                "crawl_time": r.get('crawl_time'),
-                "play_count": parse_play_count(r.get('play_count', '0')),
-                "play_count_text": r.get('play_count_text')
+    history_points = []
+    for series in history.snapshot().find(vid_or_title):
+        for epoch, play_count, play_count_text in series.points():
+            history_points.append({
+                "crawl_time": from_epoch(epoch),
+                "play_count": play_count,
+                "play_count_text": play_count_text
             })
             
     # 按时间正序排列
-    history.sort(key=lambda x: x['crawl_time'])
-    return history
+    history_points.sort(key=lambda x: x['crawl_time'])
+    return history_points
 
 @app.get("/api/crawlers/trigger")
 def trigger_crawl():
     """手动触发一次爬取"""
-    scheduler.get_job(job_id='manual_crawl') # Check if running?
     # 简单起见直接异步运行或同步运行
     # 为了快速响应，这里在后台运行，但 APScheduler 主要是定时
     # 我们可以直接调用函数，但这会阻塞
     # 放在后台任务中
-    from threading import Thread
     t = Thread(target=crawl_job)
     t.start()
     return {"message": "Crawl job started in background"}
 
+@app.get("/api/crawlers/upstream")
+def get_upstream_stats():
+    """最近一次爬取的上游连接统计"""
+    return {"stats": load_upstream_stats(), "concurrency": CRAWL_CONCURRENCY}
+
 @app.get("/api/config")
 def get_config():
     return {"accounts": load_accounts()}
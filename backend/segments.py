@@ -0,0 +1,316 @@
+import calendar
+import json
+import mmap
+import os
+import tempfile
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from store import CRAWL_TIME_FORMAT, parse_play_count, read_batch
+
+# 段文件格式（全部为定长 int64，随后是 play_count_text 字符串堆）：
+#   header: magic | 行数 rows | 视频数 n_keys | 文本数 n_texts | 字符串堆字节数 | crc32
+#   key_ids[n_keys]          段内出现的视频在维度表中的全局 ID，升序，可直接二分查找
+#   key_offsets[n_keys + 1]  每个视频的行范围
+#   epoch[rows] | play_count[rows] | text_id[rows]   行按 (key_id, epoch) 排序
+#   text_offsets[n_texts + 1] + 字符串堆（utf-8）
+# 视频 ID、元数据等只在维度表 dim.json 中存一份，.json 边车只记录源文件签名和校验值，
+# 因此每个 worker 打开段时几乎不产生私有内存，段数据全部经由 page cache 共享。
+SEGMENT_MAGIC = b"HKSEG003"
+HEADER_FIELDS = 5
+HEADER_SIZE = len(SEGMENT_MAGIC) + 8 * HEADER_FIELDS
+DIMENSION_FILE_NAME = "dim.json"
+
+
+def record_key(record: Dict) -> str:
+    """视频的唯一标识，与接口中 vid_or_title 的约定一致"""
+    return record.get('vid') or record.get('title')
+
+
+def record_info(record: Dict) -> Dict:
+    """视频的元数据，取自最新一条记录"""
+    return {
+        "app_id": record.get('app_id'),
+        "author_name": record.get('author_name'),
+        "title": record.get('title'),
+        "publish_time": record.get('publish_time'),
+    }
+
+
+def to_epoch(crawl_time: str) -> int:
+    """crawl_time（UTC 字符串）转为 epoch 秒"""
+    return calendar.timegm(time.strptime(crawl_time, CRAWL_TIME_FORMAT))
+
+
+def from_epoch(epoch: int) -> str:
+    return time.strftime(CRAWL_TIME_FORMAT, time.gmtime(epoch))
+
+
+def source_signature(path: str) -> List:
+    """源文件签名，用于判断段是否仍与源文件一致"""
+    stat = os.stat(path)
+    return [os.path.basename(path), stat.st_size, int(stat.st_mtime)]
+
+
+def file_identity(path: str) -> Optional[Tuple[int, int]]:
+    """文件的 (inode, mtime_ns)，被原子替换后会变化"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _atomic_write(path: str, write):
+    """写入进程私有的临时文件后原子替换，write(f) 负责写内容"""
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class Dimension:
+    """
+    视频维度表：全局视频 ID、key 及最新元数据，所有段共用一份
+
+    ID 只追加不复用，因此段里引用的 ID 在之后写出的维度表中一定存在。
+    """
+
+    def __init__(self, keys: List[str], info: List[Dict], epochs: List[int]):
+        self.keys = keys
+        self.info = info
+        self.epochs = epochs
+        self.key_ids = {key: i for i, key in enumerate(keys)}
+        self._indexes = None
+
+    @classmethod
+    def load(cls, path: str) -> "Dimension":
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(data["keys"], data["info"], data["epochs"])
+        except (OSError, ValueError, KeyError):
+            return cls([], [], [])
+
+    def save(self, path: str):
+        data = json.dumps({"keys": self.keys, "info": self.info, "epochs": self.epochs}, ensure_ascii=False)
+        _atomic_write(path, lambda f: f.write(data.encode('utf-8')))
+
+    def assign(self, key: str) -> int:
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = self.key_ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.info.append({})
+            self.epochs.append(-1)
+        return key_id
+
+    def update_info(self, key_id: int, info: Dict, epoch: int):
+        if epoch >= self.epochs[key_id]:
+            self.info[key_id] = info
+            self.epochs[key_id] = epoch
+
+    def indexes(self) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        """按标题、按账号的索引，每个维度表版本只构建一次"""
+        if self._indexes is None:
+            by_title: Dict[str, List[str]] = {}
+            by_app: Dict[str, List[str]] = {}
+            for key, info in zip(self.keys, self.info):
+                if info.get('title'):
+                    by_title.setdefault(info['title'], []).append(key)
+                by_app.setdefault(info.get('app_id'), []).append(key)
+            self._indexes = (by_title, by_app)
+        return self._indexes
+
+
+def write_segment(path: str, source_paths: List[str], dimension: Dimension, dimension_path: str) -> int:
+    """
+    将一组不再变化的 json 批次文件压缩为一个只读段
+
+    新出现的视频会追加到维度表，维度表先于段落盘。
+
+    Args:
+        path: 段文件路径（不含扩展名），生成 path.bin 与 path.json
+        source_paths: 按时间顺序排列的源文件
+        dimension: 维度表，会被原地更新
+        dimension_path: 维度表文件路径
+
+    Returns:
+        int: 写入的行数
+    """
+    rows: Dict[int, List] = {}
+    text_ids: Dict[str, int] = {}
+    texts: List[bytes] = []
+    sources = []
+
+    for source in source_paths:
+        sources.append(source_signature(source))
+        for record in read_batch(source):
+            key = record_key(record)
+            crawl_time = record.get('crawl_time')
+            if not key or not crawl_time:
+                continue
+            try:
+                epoch = to_epoch(crawl_time)
+            except ValueError:
+                continue
+            key_id = dimension.assign(key)
+            dimension.update_info(key_id, record_info(record), epoch)
+            text = record.get('play_count_text') or ''
+            if text not in text_ids:
+                text_ids[text] = len(texts)
+                texts.append(text.encode('utf-8'))
+            rows.setdefault(key_id, []).append(
+                (epoch, parse_play_count(record.get('play_count', '0')), text_ids[text]))
+
+    key_ids = array('q', sorted(rows))
+    key_offsets = array('q', [0])
+    epochs, plays, text_column = array('q'), array('q'), array('q')
+    for key_id in key_ids:
+        key_rows = rows[key_id]
+        key_rows.sort(key=lambda r: r[0])
+        for epoch, play, text_id in key_rows:
+            epochs.append(epoch)
+            plays.append(play)
+            text_column.append(text_id)
+        key_offsets.append(len(epochs))
+    text_offsets = array('q', [0])
+    for text in texts:
+        text_offsets.append(text_offsets[-1] + len(text))
+    blob = b"".join(texts)
+
+    body = [key_ids, key_offsets, epochs, plays, text_column, text_offsets]
+    checksum = 0
+    for column in body:
+        checksum = zlib.crc32(column.tobytes(), checksum)
+    checksum = zlib.crc32(blob, checksum)
+    total = len(epochs)
+
+    def write_bin(f):
+        f.write(SEGMENT_MAGIC)
+        f.write(array('q', [total, len(key_ids), len(texts), len(blob), checksum]).tobytes())
+        for column in body:
+            column.tofile(f)
+        f.write(blob)
+
+    meta = json.dumps({"rows": total, "checksum": checksum, "sources": sources}, ensure_ascii=False)
+
+    # 维度表先落盘；.bin 与 .json 各自原子替换，.json 最后，存在即代表段完整
+    dimension.save(dimension_path)
+    _atomic_write(path + ".bin", write_bin)
+    _atomic_write(path + ".json", lambda f: f.write(meta.encode('utf-8')))
+    return total
+
+
+class SegmentPart:
+    """某个视频在一个数据块内按时间升序排列的历史，列可以是 mmap 切片也可以是普通列表"""
+
+    __slots__ = ("epochs", "plays", "text_ids", "texts", "info")
+
+    def __init__(self, epochs, plays, text_ids, texts, info: Dict):
+        self.epochs = epochs
+        self.plays = plays
+        self.text_ids = text_ids
+        self.texts = texts
+        self.info = info
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    def text(self, index: int) -> str:
+        return self.texts[self.text_ids[index]]
+
+
+class _TextTable:
+    """映射在段文件中的 play_count_text 字符串表"""
+
+    __slots__ = ("offsets", "blob")
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __getitem__(self, index: int) -> str:
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+
+class Segment:
+    """只读段，所有数据通过 mmap 映射，多个 worker 进程经由 page cache 共享同一份物理内存"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path + ".json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.sources = [tuple(s) for s in meta["sources"]]
+        self.source_names = frozenset(s[0] for s in self.sources)
+
+        with open(path + ".bin", 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) != HEADER_SIZE or header[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                raise ValueError(f"无效的段文件: {path}.bin")
+            rows, n_keys, n_texts, blob_size, checksum = array('q', header[len(SEGMENT_MAGIC):]).tolist()
+            # .bin 与 .json 分两次替换，读到一新一旧时放弃该段，下次刷新再打开
+            if rows != meta["rows"] or checksum != meta["checksum"]:
+                raise ValueError(f"段文件与索引不匹配: {path}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mmap)
+        count = n_keys + (n_keys + 1) + 3 * rows + (n_texts + 1)
+        if len(view) != HEADER_SIZE + 8 * count + blob_size:
+            raise ValueError(f"段文件长度不正确: {path}.bin")
+        values = view[HEADER_SIZE:HEADER_SIZE + 8 * count].cast('q')
+        position = 0
+
+        def take(size):
+            nonlocal position
+            column = values[position:position + size]
+            position += size
+            return column
+
+        self.rows = rows
+        self.key_ids = take(n_keys)
+        self.key_offsets = take(n_keys + 1)
+        self.epochs = take(rows)
+        self.plays = take(rows)
+        self.text_ids = take(rows)
+        self.texts = _TextTable(take(n_texts + 1), view[HEADER_SIZE + 8 * count:])
+
+    @property
+    def max_key_id(self) -> int:
+        return self.key_ids[len(self.key_ids) - 1] if len(self.key_ids) else -1
+
+    def sources_match(self, data_dir: str) -> bool:
+        """源文件是否与封存时一致"""
+        try:
+            return all(tuple(source_signature(os.path.join(data_dir, s[0]))) == s for s in self.sources)
+        except OSError:
+            return False
+
+    def prefetch(self):
+        """提示内核预读整个段，已在 page cache 中时几乎没有开销"""
+        if hasattr(mmap, "MADV_WILLNEED"):
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+
+    def part(self, key_id: int, info: Dict) -> Optional[SegmentPart]:
+        i = bisect_left(self.key_ids, key_id)
+        if i == len(self.key_ids) or self.key_ids[i] != key_id:
+            return None
+        start, end = self.key_offsets[i], self.key_offsets[i + 1]
+        return SegmentPart(
+            self.epochs[start:end],
+            self.plays[start:end],
+            self.text_ids[start:end],
+            self.texts,
+            info,
+        )
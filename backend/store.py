@@ -0,0 +1,105 @@
+import glob
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+CRAWL_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+LEGACY_FILE_NAME = "records.json"
+
+
+def crawl_file_time(path: str) -> Optional[datetime]:
+    """从 crawl_YYYYmmdd_HHMMSS.json 文件名中解析批次时间（UTC），无法解析时返回 None"""
+    name = os.path.basename(path)
+    if not (name.startswith("crawl_") and name.endswith(".json")):
+        return None
+    try:
+        return datetime.strptime(name[len("crawl_"):-len(".json")], "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def list_data_files(data_dir: str, start: Optional[datetime] = None) -> List[str]:
+    """
+    列出 data 目录下的数据文件（legacy records.json + crawl_*.json），按批次时间排序
+
+    crawl_*.json 的文件名是批次保存时间，批次内 crawl_time（任务开始时间）不会晚于它，
+    因此文件名早于 start 的批次可以直接跳过，不必打开读取。
+    """
+    files = []
+    legacy = os.path.join(data_dir, LEGACY_FILE_NAME)
+    if os.path.exists(legacy):
+        files.append(legacy)
+
+    crawl_files = []
+    for path in glob.glob(os.path.join(data_dir, "crawl_*.json")):
+        file_time = crawl_file_time(path)
+        if file_time is not None and start is not None and file_time < start:
+            continue
+        crawl_files.append((file_time or datetime.min, path))
+    crawl_files.sort()
+    files.extend(path for _, path in crawl_files)
+    return files
+
+
+def parse_play_count(play_count_str: str) -> int:
+    """解析播放量字符串为整数"""
+    try:
+        if not play_count_str:
+            return 0
+        # 处理可能带有的单位（虽然通常API返回纯数字）
+        if '万' in play_count_str:
+            return int(float(play_count_str.replace('万', '')) * 10000)
+        return int(play_count_str)
+    except:
+        return 0
+
+
+def read_batch(path: str) -> List[Dict]:
+    """读取单个数据文件，格式错误时返回空列表"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            if isinstance(data, list):
+                return data
+    except:
+        pass
+    return []
+
+
+def iter_records(data_dir: str,
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 app_ids: Optional[Iterable[str]] = None,
+                 vids: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    """
+    逐文件流式读取记录，并按账号、视频和时间范围过滤
+
+    同一时刻只有一个批次文件在内存中，内存占用取决于单次爬取的大小而不是历史总量。
+
+    Args:
+        data_dir: 数据目录
+        start: 起始时间（含），与 crawl_time 一样为 UTC
+        end: 结束时间（含）
+        app_ids: 只保留这些账号的记录
+        vids: 只保留这些视频（匹配 vid 或 title）
+    """
+    app_id_set = set(app_ids) if app_ids else None
+    vid_set = set(vids) if vids else None
+    start_text = start.strftime(CRAWL_TIME_FORMAT) if start else None
+    end_text = end.strftime(CRAWL_TIME_FORMAT) if end else None
+
+    for path in list_data_files(data_dir, start):
+        for record in read_batch(path):
+            if app_id_set is not None and record.get('app_id') not in app_id_set:
+                continue
+            if vid_set is not None and record.get('vid') not in vid_set \
+                    and record.get('title') not in vid_set:
+                continue
+            # crawl_time 为定长的 "%Y-%m-%d %H:%M:%S"，可直接按字符串比较
+            crawl_time = record.get('crawl_time') or ''
+            if start_text and crawl_time < start_text:
+                continue
+            if end_text and crawl_time > end_text:
+                continue
+            yield record
@@ -5,7 +5,7 @@ from typing import List, Dict
 import requests
 
 # 导入 Crawler
-from backend.haokan_crawler import HaokanCrawler
+from backend.haokan_crawler import HaokanCrawler, create_session
 
 CONFIG_FILE = "config/accounts.json"
 
@@ -32,12 +32,15 @@ def migrate_accounts():
     total = len(raw_accounts)
     
     print(f"找到 {total} 个账号，开始获取昵称...")
+
+    # 所有账号共享一个 Session，复用到 haokan.baidu.com 的连接
+    session = create_session(pool_size=1)
     
     for i, app_id in enumerate(raw_accounts, 1):
         print(f"[{i}/{total}] 处理账号: {app_id}")
         
         try:
-            crawler = HaokanCrawler(app_id=app_id)
+            crawler = HaokanCrawler(app_id=app_id, session=session)
             # 先获取一个视频ID
             # 注意：为了获取作者信息，我们需要一个 vid。
             # 策略：先 fetch_author_list 获取列表，取第一个视频的 vid
@@ -71,6 +74,9 @@ def migrate_accounts():
                 "name": f"用户_{app_id}"
             })
             
+    session.close()
+    print(f"连接统计: {session.upstream_stats.snapshot()}")
+
     # 保存新配置
     save_accounts(new_accounts)
     print(f"\n迁移完成！已更新 {CONFIG_FILE}")